@@ -1,7 +1,7 @@
 """
 FORCED RAG Agent (Production Stable)
 - Always retrieves from Amazon Bedrock Knowledge Base
-- Shows FULL retrieved context in logs
+- Shows FULL retrieved context in logs (LOG_LEVEL=DEBUG)
 - Works with Gemini + LlamaIndex (all versions)
 - No tool skipping issue
 """
@@ -10,50 +10,164 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import functools
+import asyncio
+import hashlib
+import json
 import logging
-from typing import List
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple
+
+from async_lru import alru_cache
+from botocore.config import Config
+from google import genai
+from google.genai import types
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from text_ops import chunk_key, dedup_subblocks
+from vector_ops import QUANT_SCALE, int8_cosine_scores, l2_normalize, mmr_select, quantize_int8
 
 from llama_index.retrievers.bedrock import AmazonKnowledgeBasesRetriever
 from llama_index.llms.gemini import Gemini
-from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.schema import NodeWithScore, TextNode
 from llama_index.core.settings import Settings
 
 
 # -------------------------------------------------
 # 1. LOGGER CONFIG (SEE RETRIEVAL + CONTEXT)
 # -------------------------------------------------
-logging.basicConfig(level=logging.INFO)
+# Set LOG_LEVEL=DEBUG to dump every retrieved chunk and the full context
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger("agent")
 
+# Chunk-dump decoration, built once instead of per chunk
+_NL = "\n"
+_NL_PFX = "\n│ "
+
 
 # -------------------------------------------------
 # 2. BEDROCK KNOWLEDGE BASE RETRIEVER
 # -------------------------------------------------
+RETRIEVAL_TOP_K = 8  # single expanded query per turn, so fetch a wider pool
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "32"))
+RETRIEVAL_TIMEOUT_S = float(os.getenv("RETRIEVAL_TIMEOUT_S", "3.0"))
+
 retriever = AmazonKnowledgeBasesRetriever(
     knowledge_base_id=os.getenv("BEDROCK_KNOWLEDGE_BASE_ID"),
     retrieval_config={
         "vectorSearchConfiguration": {
-            "numberOfResults": 2  # increase for better context
+            "numberOfResults": RETRIEVAL_TOP_K
         }
     },
+    # Default urllib3 pool is 10 connections; concurrent hops/users queue on it.
+    # Socket timeouts and retries track RETRIEVAL_TIMEOUT_S so a call the event
+    # loop has stopped waiting for also frees its thread and connection soon
+    # after, instead of running on botocore's 60s timeouts and retry budget.
+    botocore_config=Config(
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        connect_timeout=RETRIEVAL_TIMEOUT_S,
+        read_timeout=RETRIEVAL_TIMEOUT_S,
+        retries={"max_attempts": 2, "mode": "standard"},
+    ),
+)
+
+# One worker thread per pooled connection. asyncio's default executor is
+# capped at min(32, cpu + 4) threads and shared with embedding work, which
+# would keep in-flight retrievals well below the pool size.
+bedrock_executor = ThreadPoolExecutor(
+    max_workers=BEDROCK_MAX_POOL_CONNECTIONS, thread_name_prefix="bedrock"
 )
 
+_pool_lock = threading.Lock()
+_pool_in_flight = 0
+_pool_peak = 0
+
+
+def bedrock_retrieve(query: str):
+    """Blocking Bedrock KB retrieve that tracks connection pool usage."""
+    global _pool_in_flight, _pool_peak
+    with _pool_lock:
+        _pool_in_flight += 1
+        _pool_peak = max(_pool_peak, _pool_in_flight)
+    try:
+        return retriever.retrieve(query)
+    finally:
+        with _pool_lock:
+            _pool_in_flight -= 1
+
+
+async def retrieve_with_timeout(query: str) -> Optional[list]:
+    """
+    Bedrock retrieve bounded by RETRIEVAL_TIMEOUT_S
+    Returns None on timeout or error, so the turn can still answer without
+    context but knows not to cache that answer
+    """
+    try:
+        async with asyncio.timeout(RETRIEVAL_TIMEOUT_S):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(bedrock_executor, bedrock_retrieve, query)
+    except TimeoutError:
+        logger.warning("Bedrock retrieval timed out after %.1fs: %s", RETRIEVAL_TIMEOUT_S, query)
+    except Exception as e:
+        logger.error(f"Bedrock retrieval failed: {e}")
+    return None
+
+
+def pool_stats() -> dict:
+    """Bedrock connection pool usage, for tuning BEDROCK_MAX_POOL_CONNECTIONS."""
+    with _pool_lock:
+        return {
+            "max_pool_connections": BEDROCK_MAX_POOL_CONNECTIONS,
+            "in_flight": _pool_in_flight,
+            "peak_in_flight": _pool_peak,
+        }
+
 
 # -------------------------------------------------
 # 3. GEMINI LLM (IMPORTANT: CORRECT MODEL NAME)
 # -------------------------------------------------
+GEMINI_MODEL = "gemini-2.5-flash"  # DO NOT use models/ prefix
+# Bounds each Gemini call; for the streamed answer, the max gap between chunks
+GENERATION_TIMEOUT_S = float(os.getenv("GENERATION_TIMEOUT_S", "15.0"))
+
+# Kept for LlamaIndex components that read Settings.llm
 llm = Gemini(
-    model="gemini-2.5-flash",  # DO NOT use models/ prefix
+    model=GEMINI_MODEL,
     api_key=os.getenv("GOOGLE_API_KEY"),
     temperature=0.2,
 )
 
 Settings.llm = llm
 
+# Hot path calls google-genai directly, skipping the LlamaIndex message
+# conversion and pydantic validation on every request
+genai_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+
+# Built once so every turn sends a byte-identical system prefix, which is what
+# Gemini's implicit prefix caching keys on.
+SYSTEM_PROMPT = (
+    "You are a medical product assistant.\n"
+    "Answer ONLY using the provided knowledge base context.\n"
+    "If context is empty, say you don't have data.\n"
+    "User may speak Hindi, Hinglish, or English.\n"
+    "Respond in user's language."
+)
+ANSWER_CONFIG = types.GenerateContentConfig(
+    system_instruction=SYSTEM_PROMPT,
+    temperature=0.2,
+)
+
 
 # -------------------------------------------------
 # 4. QUERY NORMALIZER (Hinglish → English for better retrieval)
 # -------------------------------------------------
+@functools.lru_cache(maxsize=4096)
 def normalize_query(query: str) -> str:
     q = query.lower()
 
@@ -67,46 +181,405 @@ def normalize_query(query: str) -> str:
 
 
 # -------------------------------------------------
-# 5. MULTI-HOP QUERY GENERATOR (Generate related queries)
+# 5. CHUNK IDENTITY (stable dedup + deterministic ordering)
 # -------------------------------------------------
-async def generate_multi_hop_queries(original_query: str) -> List[str]:
+def chunk_sort_key(metadata: dict, text_key: bytes) -> Tuple[str, str, bytes]:
+    """Order chunks by (doc_id, chunk_id) from Bedrock KB source metadata."""
+    source = (metadata or {}).get("sourceMetadata") or {}
+    doc_id = str(source.get("x-amz-bedrock-kb-source-uri", ""))
+    chunk_id = str(source.get("x-amz-bedrock-kb-chunk-id", ""))
+    return doc_id, chunk_id, text_key
+
+
+# -------------------------------------------------
+# 6. SEMANTIC QUERY CACHE (exact SHA-1 + cosine similarity)
+# -------------------------------------------------
+embed_model = SentenceTransformer("paraphrase-albert-small-v2")
+
+SEMANTIC_CACHE_THRESHOLD = 0.86   # cosine similarity needed for a hit
+SEMANTIC_CACHE_MAX_ENTRIES = 100_000
+SEMANTIC_CACHE_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL_S", "21600"))  # 6h
+FAISS_MIN_ENTRIES = 4096          # switch from numpy matmul to FAISS above this
+
+
+@functools.lru_cache(maxsize=4096)
+def embed(text: str) -> np.ndarray:
     """
-    Generate related queries for multi-hop retrieval
-    This helps retrieve more comprehensive context from different angles
+    Embed text into an L2-normalized float32 vector
+    Cached by text, so repeated turns skip the model; the returned array is
+    shared between callers and therefore read-only.
+    """
+    vector = np.asarray(embed_model.encode(text, normalize_embeddings=True), dtype=np.float32)
+    vector.setflags(write=False)
+    return vector
+
+
+class SemanticCache:
+    """
+    Two-tier answer cache in front of the RAG pipeline
+    1. Byte-exact lookup on SHA-1 of the whitespace-collapsed user message
+    2. Cosine-similarity probe over cached message embeddings
+    Keys come from the raw message, not normalize_query(): the answer
+    depends on the message (wording, language), and normalization maps
+    many different messages onto one string.
+
+    Embeddings are L2-normalized, quantized to int8 and kept in one
+    contiguous (capacity, dim) matrix (4x smaller than float32). A probe is
+    a single int8 matrix-vector product with an int32 accumulator.
+
+    Entries expire after ttl_s and are evicted oldest-first once
+    max_entries is reached; since every entry has the same TTL, insertion
+    order is also expiry order. The whole cache is dropped when the KB
+    version changes (see ensure_version).
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_s: float = SEMANTIC_CACHE_TTL_S):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._version = None
+        self.clear()
+
+    def clear(self) -> None:
+        self._exact = {}                # sha1(message) -> entry id
+        self._entries = OrderedDict()   # entry id -> (key, created_at, context_chunks, final_answer), oldest first
+        self._next_id = 0
+        self._matrix = None             # int8 embeddings; row r belongs to entry self._row_ids[r]
+        self._row_ids = None            # -1 marks a free row
+        self._row_of = {}               # entry id -> row
+        self._free_rows = []
+        self._used_rows = 0
+        self._index = None              # FAISS IndexIDMap2 (SQ8) once the cache is large
+
+    def ensure_version(self, version) -> None:
+        """Drop every entry when the knowledge base version changes."""
+        if version != self._version:
+            if self._entries:
+                logger.info("🧹 KB changed; clearing %d semantic cache entries", len(self._entries))
+            self.clear()
+            self._version = version
+
+    @staticmethod
+    def _key(query: str) -> bytes:
+        return hashlib.sha1(query.encode("utf-8")).digest()
+
+    def _evict(self, entry_id: int) -> None:
+        key, _, _, _ = self._entries.pop(entry_id)
+        del self._exact[key]
+        if self._index is not None:
+            self._index.remove_ids(np.array([entry_id], dtype=np.int64))
+        else:
+            row = self._row_of.pop(entry_id)
+            self._row_ids[row] = -1
+            self._free_rows.append(row)
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_s
+        while self._entries:
+            oldest_id, (_, created_at, _, _) = next(iter(self._entries.items()))
+            if created_at >= cutoff:
+                break
+            self._evict(oldest_id)
+
+    def lookup(self, query: str, query_embedding: np.ndarray) -> Optional[Tuple[List[str], str]]:
+        self._expire()
+
+        entry_id = self._exact.get(self._key(query))
+        if entry_id is not None:
+            logger.info("⚡ SEMANTIC CACHE HIT (exact)")
+            return self._entries[entry_id][2:]
+
+        if not self._entries:
+            return None
+
+        q = l2_normalize(query_embedding)
+        if self._index is not None:
+            scores, ids = self._index.search(q[None, :], 1)
+            entry_id, best_score = int(ids[0][0]), float(scores[0][0])
+        else:
+            scores = int8_cosine_scores(self._matrix[:self._used_rows], q)
+            scores[self._row_ids[:self._used_rows] < 0] = -np.inf
+            best = int(scores.argmax())
+            entry_id = int(self._row_ids[best])
+            best_score = float(scores[best])
+
+        if entry_id >= 0 and best_score > self.threshold:
+            logger.info("⚡ SEMANTIC CACHE HIT (cosine=%.4f)", best_score)
+            return self._entries[entry_id][2:]
+        return None
+
+    def add(self, query: str, query_embedding: np.ndarray,
+            context_chunks: List[str], final_answer: str) -> None:
+        key = self._key(query)
+        if key in self._exact:
+            return
+        self._expire()
+        while len(self._entries) >= self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+        row = l2_normalize(query_embedding)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._exact[key] = entry_id
+        self._entries[entry_id] = (key, time.monotonic(), context_chunks, final_answer)
+
+        if self._index is not None:
+            self._index.add_with_ids(row[None, :], np.array([entry_id], dtype=np.int64))
+            return
+
+        if self._free_rows:
+            slot = self._free_rows.pop()
+        else:
+            # Grow geometrically so inserts are amortized O(dim), not a full copy
+            slot = self._used_rows
+            if self._matrix is None:
+                self._matrix = np.empty((64, row.shape[0]), dtype=np.int8)
+                self._row_ids = np.full(64, -1, dtype=np.int64)
+            elif slot == self._matrix.shape[0]:
+                grown = np.empty((slot * 2, row.shape[0]), dtype=np.int8)
+                grown[:slot] = self._matrix
+                self._matrix = grown
+                self._row_ids = np.concatenate([self._row_ids, np.full(slot, -1, dtype=np.int64)])
+            self._used_rows += 1
+        self._matrix[slot] = quantize_int8(row)
+        self._row_ids[slot] = entry_id
+        self._row_of[entry_id] = slot
+
+        if len(self._entries) >= FAISS_MIN_ENTRIES:
+            # 8-bit scalar quantizer keeps the FAISS tier at int8 footprint too;
+            # the ID map lets evicted entries be removed by id
+            live = self._row_ids[:self._used_rows] >= 0
+            vectors = self._matrix[:self._used_rows][live].astype(np.float32) / QUANT_SCALE
+            ids = self._row_ids[:self._used_rows][live]
+            quantizer = faiss.IndexScalarQuantizer(
+                row.shape[0], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            quantizer.train(vectors)
+            self._index = faiss.IndexIDMap2(quantizer)
+            self._index.add_with_ids(vectors, ids)
+            self._matrix = self._row_ids = None
+            self._row_of, self._free_rows, self._used_rows = {}, [], 0
+
+
+semantic_cache = SemanticCache()
+
+
+# -------------------------------------------------
+# 7. MMR RERANK (relevance vs. redundancy before prompting)
+# -------------------------------------------------
+MMR_TOP_K = 5
+MMR_LAMBDA = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+
+
+def embed_batch(texts: List[str]) -> np.ndarray:
+    """Embed texts into a (len(texts), dim) matrix of L2-normalized float32 rows."""
+    vectors = embed_model.encode(texts, normalize_embeddings=True)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+# -------------------------------------------------
+# 8. LOCAL KB SNAPSHOT (FAISS HNSW in front of Bedrock)
+# -------------------------------------------------
+KB_SNAPSHOT_PATH = os.getenv("KB_SNAPSHOT_PATH", "")
+KB_SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("KB_SNAPSHOT_MAX_AGE_HOURS", "24"))
+LOCAL_INDEX_MIN_SCORE = float(os.getenv("LOCAL_INDEX_MIN_SCORE", "0.3"))  # below = miss
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 100
+HNSW_EF_SEARCH = 64
+
+
+class LocalKBIndex:
+    """
+    FAISS HNSW index over a local snapshot of the Bedrock KB
+    The snapshot is a JSONL export of the KB chunks, one per line:
+    {"text": "...", "metadata": {...}, "embedding": [...]}
+    "metadata" should keep Bedrock's shape (sourceMetadata etc.) so
+    ordering matches Bedrock results. "embedding" is optional and must come
+    from embed_model; missing embeddings are computed at load time.
+    When the file is rewritten (e.g. by cron), the next turn triggers a
+    background reload; the previous snapshot keeps serving meanwhile.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._snapshot = None        # (index, records, mtime), swapped atomically
+        self._attempted_mtime = None  # last file version a load was started for
+        self._reload_task = None
+
+    def load(self) -> None:
+        mtime = os.path.getmtime(self.path)
+        self._attempted_mtime = mtime
+
+        texts, metadatas, embeddings = [], [], []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                texts.append(record["text"])
+                metadatas.append(record.get("metadata") or {})
+                embeddings.append(record.get("embedding"))
+
+        if not texts:
+            logger.warning("KB snapshot %s is empty; using Bedrock only", self.path)
+            return
+
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            computed = embed_batch([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                embeddings[i] = vector
+        vectors = l2_normalize(np.vstack(embeddings))
+
+        index = faiss.IndexHNSWFlat(vectors.shape[1], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        index.add(vectors)
+
+        self._snapshot = (index, list(zip(texts, metadatas)), mtime)
+        logger.info("📦 Loaded KB snapshot: %d chunks from %s", len(texts), self.path)
+
+    def reload(self) -> None:
+        """load() that logs instead of raising, so a bad snapshot never breaks a turn."""
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Failed to load KB snapshot {self.path}: {e}")
+
+    def refresh_if_updated(self) -> None:
+        """Start a background reload if the snapshot file changed since the last load."""
+        if self._reload_task is not None and not self._reload_task.done():
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._attempted_mtime:
+            self._attempted_mtime = mtime
+            self._reload_task = asyncio.create_task(asyncio.to_thread(self.reload))
+
+    @property
+    def version(self) -> Optional[float]:
+        """mtime of the snapshot currently serving, or None before the first load."""
+        return self._snapshot[2] if self._snapshot is not None else None
+
+    def is_fresh(self) -> bool:
+        if self._snapshot is None:
+            return False
+        age_hours = (time.time() - self._snapshot[2]) / 3600
+        return age_hours <= KB_SNAPSHOT_MAX_AGE_HOURS
+
+    def search(self, query_embedding: np.ndarray, k: int = RETRIEVAL_TOP_K) -> List[NodeWithScore]:
+        """Top-k snapshot chunks as nodes shaped like Bedrock retriever results."""
+        index, records, _ = self._snapshot
+        scores, ids = index.search(l2_normalize(query_embedding)[None, :], k)
+        nodes = []
+        for score, idx in zip(scores[0], ids[0]):
+            if idx < 0:  # fewer than k vectors in the index
+                continue
+            text, metadata = records[idx]
+            nodes.append(NodeWithScore(node=TextNode(text=text, metadata=metadata), score=float(score)))
+        return nodes
+
+
+kb_snapshot = LocalKBIndex(KB_SNAPSHOT_PATH) if KB_SNAPSHOT_PATH else None
+if kb_snapshot is not None:
+    kb_snapshot.reload()
+
+
+async def retrieve_hop(query: str) -> Optional[list]:
+    """
+    Serve a hop from the local KB snapshot when it is fresh and confident,
+    falling back to Bedrock on a stale snapshot or an index miss
+    """
+    if kb_snapshot is not None:
+        kb_snapshot.refresh_if_updated()
+    if kb_snapshot is not None and kb_snapshot.is_fresh():
+        query_embedding = await asyncio.to_thread(embed, query)
+        nodes = kb_snapshot.search(query_embedding)
+        if nodes and nodes[0].score >= LOCAL_INDEX_MIN_SCORE:
+            return nodes
+        logger.info("Local KB index miss; falling back to Bedrock")
+    return await retrieve_with_timeout(query)
+
+
+# -------------------------------------------------
+# 9. MULTI-HOP QUERY GENERATOR (Generate related queries)
+# -------------------------------------------------
+MULTI_HOP_GENERATION_CONFIG = types.GenerateContentConfig(
+    temperature=0.2,
+    response_mime_type="application/json",
+    response_schema=list[str],
+    max_output_tokens=128,  # 2-3 short queries; bounds generation latency
+    # Thinking tokens count against max_output_tokens and add latency
+    thinking_config=types.ThinkingConfig(thinking_budget=0),
+)
+
+
+@alru_cache(maxsize=1024)
+async def _generate_multi_hop_queries(original_query: str) -> Tuple[str, ...]:
+    """
+    Cached Gemini call for multi-hop query generation
+    Raises on failure so errors are never cached
     """
-    logger.info("\n🔄 GENERATING MULTI-HOP QUERIES...\n")
-    
     multi_hop_prompt = f"""Given this user query, generate 2-3 related search queries that would help find comprehensive information.
 
 Original Query: "{original_query}"
 
-Return ONLY the queries as a comma-separated list, no explanations.
-Example: "query1, query2, query3"
+Return ONLY a JSON array of query strings, no explanations.
+Example: ["query1", "query2", "query3"]
 """
+
+    response = await genai_client.aio.models.generate_content(
+        model=GEMINI_MODEL,
+        contents=multi_hop_prompt,
+        config=MULTI_HOP_GENERATION_CONFIG,
+    )
+
+    # JSON mode + schema guarantees a single deterministic parse
+    parsed = json.loads(response.text)
+    return tuple(q.strip() for q in parsed if isinstance(q, str) and q.strip())
+
+
+async def generate_multi_hop_queries(original_query: str) -> List[str]:
+    """
+    Generate related queries for multi-hop retrieval
+    This helps retrieve more comprehensive context from different angles
+    """
+    logger.info("\n🔄 GENERATING MULTI-HOP QUERIES...\n")
     
     try:
-        response = await llm.achat([
-            ChatMessage(role=MessageRole.USER, content=multi_hop_prompt)
-        ])
-        
-        generated_queries_text = response.message.content
-        # Parse the comma-separated queries
-        generated_queries = [q.strip() for q in generated_queries_text.split(",")]
+        async with asyncio.timeout(GENERATION_TIMEOUT_S):
+            generated_queries = list(await _generate_multi_hop_queries(original_query))
         
         logger.info("📝 Generated Multi-Hop Queries:")
         for i, q in enumerate(generated_queries, 1):
             logger.info(f"  {i}. {q}")
         
         return generated_queries
+    except TimeoutError:
+        logger.warning("Multi-hop query generation timed out after %.1fs", GENERATION_TIMEOUT_S)
+        return []
     except Exception as e:
         logger.error(f"Error generating multi-hop queries: {e}")
         return []
 
 
 # -------------------------------------------------
-# 6. CORE RAG FUNCTION WITH MULTI-HOP RETRIEVAL
+# 10. CORE RAG FUNCTION WITH MULTI-HOP RETRIEVAL
 # -------------------------------------------------
-async def get_agent_response(message: str, chat_history: List[dict]):
+async def get_agent_response(message: str, chat_history: List[dict],
+                             query_embedding: Optional[np.ndarray] = None) -> AsyncIterator[str]:
+    """
+    Answer a user message, yielding the Gemini response as it streams in
+    query_embedding, if given, must be embed_model's embedding of the
+    normalized query. Only the MMR rerank needs it, so it is otherwise
+    computed lazily when the rerank runs. Retrieval embeds the expanded
+    multi-hop query instead.
+    """
     logger.info("=" * 80)
     logger.info("💬 NEW USER MESSAGE: %s", message)
     logger.info("=" * 80)
@@ -115,84 +588,109 @@ async def get_agent_response(message: str, chat_history: List[dict]):
     normalized_query = normalize_query(message)
     logger.info("🌍 NORMALIZED QUERY: %s", normalized_query)
 
+    # Short-circuit on a cached answer for the same or a near-identical
+    # message. Keyed on the message itself, since the answer follows its
+    # wording and language. Equal strings share embed()'s LRU entry.
+    cache_key = " ".join(message.split())
+    cache_embedding = await asyncio.to_thread(embed, cache_key)
+    semantic_cache.ensure_version(kb_snapshot.version if kb_snapshot is not None else None)
+    cached = semantic_cache.lookup(cache_key, cache_embedding)
+    if cached is not None:
+        _, final_answer = cached
+        yield final_answer
+        return
+
     # Step 2: Generate Multi-Hop Queries
     all_queries = [normalized_query]  # Start with original query
     generated_queries = await generate_multi_hop_queries(message)
     all_queries.extend(generated_queries)
-    
-    # Step 3: Retrieve Context from All Queries
-    logger.info("\n🚀 STARTING MULTI-HOP RETRIEVAL FROM AMAZON BEDROCK KB...\n")
-    logger.info("Total Queries to Retrieve: %d", len(all_queries))
-    
+
+    # Step 3: Retrieve Context with a single expanded query. Folding the hops
+    # into one richer query costs one Bedrock round-trip instead of N.
+    expanded_query = " ".join(all_queries)
+
+    logger.info("\n🚀 STARTING MULTI-HOP RETRIEVAL (LOCAL KB SNAPSHOT → AMAZON BEDROCK KB)...\n")
+    logger.info("Total Queries Folded Into Retrieval: %d", len(all_queries))
+
+    # Time-bounded and never raises; None means retrieval failed
+    nodes = await retrieve_hop(expanded_query)
+    retrieval_failed = nodes is None
+    nodes = nodes or []
+
+    top_score = max((float(getattr(n, "score", 0.0) or 0.0) for n in nodes), default=0.0)
+    logger.info("📍 Retrieved %d chunks (top score %.4f)", len(nodes), top_score)
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug("Retrieval query: %s", expanded_query)
+
     all_context_chunks = {}
-    
-    for query_idx, query in enumerate(all_queries, 1):
-        logger.info("\n" + "=" * 80)
-        logger.info(f"📍 HOP {query_idx}: Retrieving for '{query}'")
-        logger.info("=" * 80)
+
+    for i, node in enumerate(nodes, 1):
+        score = getattr(node, "score", 0.0)
+        text = node.node.get_content()
+        metadata = getattr(node.node, "metadata", {})
         
-        nodes = retriever.retrieve(query)
-        logger.info(f"Retrieved {len(nodes)} chunks for this query\n")
+        # Stable SHA-1 over whitespace/case-normalized text to avoid duplicates
+        text_key = chunk_key(text)
+        if text_key not in all_context_chunks:
+            all_context_chunks[text_key] = {
+                "text": text,
+                "score": float(score),
+                "metadata": metadata,
+            }
         
-        for i, node in enumerate(nodes, 1):
-            score = getattr(node, "score", 0.0)
-            text = node.node.get_content()
-            metadata = getattr(node.node, "metadata", {})
-            
-            # Use text hash to avoid duplicates
-            text_key = hash(text)
-            if text_key not in all_context_chunks:
-                all_context_chunks[text_key] = {
-                    "text": text,
-                    "score": float(score),
-                    "metadata": metadata,
-                    "sources": [query_idx]
-                }
-            else:
-                # Track if chunk appeared in multiple queries
-                all_context_chunks[text_key]["sources"].append(query_idx)
-            
-            logger.info(f"┌─ CHUNK {i} (Hop {query_idx}) ─────────────────────────")
-            logger.info(f"│ Score: {float(score):.4f}")
-            logger.info(f"│ Metadata: {metadata}")
-            logger.info("├─ Content:")
-            logger.info(f"│ {text.replace(chr(10), chr(10) + '│ ')}")
-            logger.info("└────────────────────────────────────────────────\n")
+        # Decorative chunk dump is O(chunk bytes); only build it at DEBUG
+        if debug:
+            logger.debug("┌─ CHUNK %d ─────────────────────────", i)
+            logger.debug("│ Score: %.4f", float(score))
+            logger.debug("│ Metadata: %s", metadata)
+            logger.debug("├─ Content:")
+            logger.debug("│ %s", text.replace(_NL, _NL_PFX))
+            logger.debug("└────────────────────────────────────────────────\n")
     
-    # Step 4: Sort chunks by score and combine
+    # Step 4: MMR-select the top chunks, then sort them deterministically so
+    # identical evidence sets produce byte-identical prompt prefixes
+    candidates = list(all_context_chunks.items())
+    if len(candidates) > MMR_TOP_K:
+        chunk_embeddings = await asyncio.to_thread(
+            embed_batch, [item[1]["text"] for item in candidates]
+        )
+        # The normalized-query vector is only needed here, so embed it lazily:
+        # cache hits and small candidate sets never pay for it
+        if query_embedding is None:
+            query_embedding = await asyncio.to_thread(embed, normalized_query)
+        else:
+            query_embedding = l2_normalize(query_embedding)
+        keep = mmr_select(query_embedding, chunk_embeddings, MMR_TOP_K, MMR_LAMBDA)
+        candidates = [candidates[i] for i in keep]
+
     sorted_chunks = sorted(
-        all_context_chunks.items(),
-        key=lambda x: x[1]["score"],
-        reverse=True
+        candidates,
+        key=lambda x: chunk_sort_key(x[1]["metadata"], x[0])
     )
     
-    context_chunks = [item[1]["text"] for item in sorted_chunks]
-    context = "\n\n------\n\n".join(context_chunks)
+    # Collapse sub-blocks repeated across hops to shrink the Gemini prompt
+    context_chunks = dedup_subblocks([item[1]["text"] for item in sorted_chunks])
+    # ¶ labels give the "[see ¶N above]" references something to point at
+    context = "\n\n------\n\n".join(
+        f"¶{n}\n{chunk}" for n, chunk in enumerate(context_chunks, 1)
+    )
 
-    logger.info("\n" + "=" * 80)
-    logger.info("📊 MULTI-HOP RETRIEVAL SUMMARY:")
-    logger.info("=" * 80)
-    logger.info(f"Total Unique Chunks Retrieved: {len(context_chunks)}")
-    logger.info(f"Queries Used: {len(all_queries)}")
-    for idx, query in enumerate(all_queries, 1):
-        prefix = "🎯 Original: " if idx == 1 else "🔗 Generated: "
-        logger.info(f"{prefix} {query}")
-    logger.info("=" * 80)
+    logger.info(
+        "📊 MULTI-HOP RETRIEVAL SUMMARY: %d/%d chunks kept from %d queries (%d context chars)",
+        len(context_chunks), len(all_context_chunks), len(all_queries), len(context),
+    )
+    if logger.isEnabledFor(logging.DEBUG):
+        for idx, query in enumerate(all_queries, 1):
+            prefix = "🎯 Original: " if idx == 1 else "🔗 Generated: "
+            logger.debug("%s %s", prefix, query)
 
-    logger.info("\n🧠 FINAL COMBINED CONTEXT SENT TO LLM:")
-    logger.info("=" * 80)
-    logger.info(context if context else "NO CONTEXT RETRIEVED")
-    logger.info("=" * 80)
+        logger.debug("\n🧠 FINAL COMBINED CONTEXT SENT TO LLM:")
+        logger.debug("=" * 80)
+        logger.debug("%s", context if context else "NO CONTEXT RETRIEVED")
+        logger.debug("=" * 80)
 
     # Step 5: Build Prompt (STRICT RAG)
-    system_prompt = (
-        "You are a medical product assistant.\n"
-        "Answer ONLY using the provided knowledge base context.\n"
-        "If context is empty, say you don't have data.\n"
-        "User may speak Hindi, Hinglish, or English.\n"
-        "Respond in user's language."
-    )
-
     user_prompt = f"""
 USER QUESTION:
 {message}
@@ -206,19 +704,48 @@ Provide comprehensive answer using information from multiple sources if availabl
 """
 
     # Step 6: Send to LLM with combined context
-    messages = [
-        ChatMessage(role=MessageRole.SYSTEM, content=system_prompt),
-        ChatMessage(role=MessageRole.USER, content=user_prompt),
-    ]
-
     logger.info("\n🤖 SENDING MULTI-HOP CONTEXT + QUERY TO GEMINI...\n")
 
-    response = await llm.achat(messages)
-
-    final_answer = response.message.content
-
-    logger.info("🤖 FINAL LLM RESPONSE:")
-    logger.info(final_answer)
-    logger.info("=" * 80 + "\n")
-
-    return final_answer
\ No newline at end of file
+    # Stream tokens back as they arrive to cut time-to-first-token. Each
+    # wait for the next chunk is bounded separately, so stalls are caught
+    # without cutting off long answers (and no timeout spans a yield).
+    parts = []
+    try:
+        async with asyncio.timeout(GENERATION_TIMEOUT_S):
+            stream = await genai_client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=user_prompt,
+                config=ANSWER_CONFIG,
+            )
+        while True:
+            async with asyncio.timeout(GENERATION_TIMEOUT_S):
+                chunk = await anext(stream, None)
+            if chunk is None:
+                break
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+    except TimeoutError:
+        logger.warning("Gemini answer stalled for %.1fs; ending turn", GENERATION_TIMEOUT_S)
+        yield "\n\n⚠️ The response timed out. Please try again."
+        return
+
+    final_answer = "".join(parts)
+
+    # A blocked response (safety/recitation) streams no text at all; never
+    # cache that, or every later hit shows an empty bubble
+    if not final_answer:
+        logger.warning("Gemini returned no text; not caching")
+        yield "⚠️ I couldn't generate an answer for this question. Please try rephrasing it."
+        return
+
+    logger.info("🤖 FINAL LLM RESPONSE: %d chars", len(final_answer))
+    logger.debug("%s", final_answer)
+
+    # An answer built without context ("I don't have data") must not outlive
+    # the outage or gap that caused it
+    if retrieval_failed or not all_context_chunks:
+        logger.info("No retrieved context; not caching this answer")
+        return
+
+    semantic_cache.add(cache_key, cache_embedding, context_chunks, final_answer)
\ No newline at end of file
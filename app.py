@@ -1,6 +1,17 @@
 
+import os
+
 import gradio as gr
-from agent import get_agent_response
+from agent import get_agent_response, pool_stats
+
+# Concurrent chat turns per process; keep within the Bedrock/Gemini TPS quota
+# and below BEDROCK_MAX_POOL_CONNECTIONS
+GRADIO_CONCURRENCY_LIMIT = int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "16"))
+GRADIO_MAX_QUEUE_SIZE = int(os.getenv("GRADIO_MAX_QUEUE_SIZE", "64"))
+ENABLE_DEBUG_API = (
+    os.getenv("ENABLE_DEBUG_API", "").lower() in ("1", "true", "yes")
+    or os.getenv("LOG_LEVEL", "").upper() == "DEBUG"
+)
 
 def create_gradio_interface():
     with gr.Blocks(title="🤖 Chatbot with Knowledge Base") as demo:
@@ -47,21 +58,32 @@ def create_gradio_interface():
         
         async def call_agent(history):
             if not history or history[-1]["role"] != "user":
-                return history
+                yield history
+                return
             
             user_message, chat_history = history[-1]["content"], history[:-1]
-            response = await get_agent_response(user_message, chat_history)
             
-            history.append({"role": "assistant", "content": response})
-            return history
+            history.append({"role": "assistant", "content": ""})
+            async for partial in get_agent_response(user_message, chat_history):
+                history[-1]["content"] += partial
+                yield history
 
         submit_btn.click(user_submit, [msg, history], [msg, history]).then(
             call_agent, history, history
         )
+
+        # Debug endpoint (/gradio_api/call/pool_stats), unauthenticated, so
+        # only exposed when explicitly enabled
+        if ENABLE_DEBUG_API:
+            gr.api(pool_stats, api_name="pool_stats")
     return demo
 
 if __name__ == "__main__":
     app = create_gradio_interface()
+    app.queue(
+        default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT,
+        max_size=GRADIO_MAX_QUEUE_SIZE,
+    )
     app.launch(
         server_name="0.0.0.0",
         server_port=8080,
@@ -0,0 +1,66 @@
+import xxhash
+
+from text_ops import CDC_MODULUS, chunk_key, dedup_subblocks, split_subblocks
+
+
+def _is_boundary(sentence):
+    normalized = " ".join(sentence.split()).lower()
+    return xxhash.xxh64_intdigest(normalized.encode("utf-8")) % CDC_MODULUS == 0
+
+
+def _sentences(boundary, count):
+    """Distinct sentences that do (or do not) close a sub-block."""
+    found, i = [], 0
+    while len(found) < count:
+        sentence = f"Product fact number {i}."
+        if _is_boundary(sentence) == boundary:
+            found.append(sentence)
+        i += 1
+    return found
+
+
+N = _sentences(boundary=False, count=5)
+B = _sentences(boundary=True, count=5)
+
+
+def test_chunk_key_ignores_whitespace_and_case():
+    assert chunk_key("Liver  Detox\nSupplement") == chunk_key("liver detox supplement")
+    assert chunk_key("liver detox") != chunk_key("liver tonic")
+
+
+def test_split_subblocks_preserves_text():
+    texts = [
+        "",
+        "single line without a full stop",
+        f"{N[0]} {B[0]} {N[1]}\n{B[1]}\n\nTrailing line",
+        "यह लिवर के लिए अच्छा है। रोज़ दो कैप्सूल लें। Price is Rs 499!",
+        "  leading and trailing whitespace.  ",
+    ]
+    for text in texts:
+        assert "".join(split_subblocks(text)) == text
+
+
+def test_split_subblocks_closes_blocks_on_boundary_sentences():
+    assert split_subblocks(f"{N[0]} {B[0]} {N[1]} {B[1]}") == [
+        f"{N[0]} {B[0]}",
+        f" {N[1]} {B[1]}",
+    ]
+
+
+def test_dedup_subblocks_references_and_drops():
+    first = f"{N[0]} {B[0]} {N[1]} {B[1]}"
+    second = f"{N[2]} {B[2]} {N[1]} {B[1]}"   # second block repeats ¶1
+    repeat = first                             # fully repeated: dropped
+    fourth = f"{N[3]} {B[3]} {N[2]} {B[2]}"   # numbered after the drop, repeats ¶2
+
+    assert dedup_subblocks([first, second, repeat, fourth]) == [
+        first,
+        f"{N[2]} {B[2]} [see ¶1 above]",
+        f"{N[3]} {B[3]} [see ¶2 above]",
+    ]
+
+
+def test_dedup_subblocks_collapses_a_repeated_run_into_one_reference():
+    first = f"{N[0]} {B[0]} {N[1]} {B[1]}"
+    second = f"{N[4]} {B[4]} {N[0]} {B[0]} {N[1]} {B[1]}"
+    assert dedup_subblocks([first, second]) == [first, f"{N[4]} {B[4]} [see ¶1 above]"]
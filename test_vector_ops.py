@@ -0,0 +1,68 @@
+import numpy as np
+
+from vector_ops import QUANT_SCALE, int8_cosine_scores, l2_normalize, mmr_select, quantize_int8
+
+
+def reference_mmr(query_embedding, embeddings, k, lambda_mult):
+    """Classic MMR loop: redundancy is the true max similarity to the selected set."""
+    relevance = embeddings @ query_embedding
+    selected, remaining = [], list(range(len(embeddings)))
+    while remaining and len(selected) < k:
+        best, best_score = remaining[0], float("-inf")
+        for i in remaining:
+            redundancy = max(
+                (float(embeddings[i] @ embeddings[j]) for j in selected),
+                default=0.0,
+            )
+            score = lambda_mult * float(relevance[i]) - (1 - lambda_mult) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+def test_mmr_select_matches_reference_loop():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        embeddings = l2_normalize(rng.standard_normal((8, 16)))
+        query = l2_normalize(rng.standard_normal(16))
+        assert mmr_select(query, embeddings, 5, 0.7) == reference_mmr(query, embeddings, 5, 0.7)
+
+
+def test_mmr_select_returns_all_rows_when_k_exceeds_candidates():
+    rng = np.random.default_rng(1)
+    embeddings = l2_normalize(rng.standard_normal((3, 4)))
+    query = l2_normalize(rng.standard_normal(4))
+    assert sorted(mmr_select(query, embeddings, 5, 0.7)) == [0, 1, 2]
+
+
+def test_quantize_int8_stays_in_symmetric_range():
+    rng = np.random.default_rng(2)
+    quantized = quantize_int8(l2_normalize(rng.standard_normal((50, 384))))
+    assert quantized.dtype == np.int8
+    assert quantized.min() >= -QUANT_SCALE and quantized.max() <= QUANT_SCALE
+
+
+def test_int8_cosine_scores_track_float_cosine():
+    # The semantic cache compares these scores against a float cosine
+    # threshold (0.86), so the int8 round trip must stay close to it
+    rng = np.random.default_rng(3)
+    rows = l2_normalize(rng.standard_normal((200, 384)))
+    query = l2_normalize(rows[0] + 0.3 * rng.standard_normal(384))
+    scores = int8_cosine_scores(quantize_int8(rows), query)
+    assert scores.dtype == np.float32
+    # Per-component rounding is at most 1/254; over 384 dims that sums to ~0.01
+    assert np.abs(scores - rows @ query).max() < 0.02
+    assert int(scores.argmax()) == 0
+
+
+def test_int8_cosine_scores_near_the_cache_threshold():
+    rng = np.random.default_rng(4)
+    for _ in range(100):
+        row = l2_normalize(rng.standard_normal(384))
+        noise = l2_normalize(rng.standard_normal(384))
+        noise = l2_normalize(noise - (noise @ row) * row)
+        query = l2_normalize(0.86 * row + np.sqrt(1 - 0.86 ** 2) * noise)  # cosine 0.86
+        score = float(int8_cosine_scores(quantize_int8(row[None, :]), query)[0])
+        assert abs(score - 0.86) < 0.02
@@ -0,0 +1,73 @@
+"""
+Chunk text helpers for the RAG agent (pure Python, no model or client setup)
+"""
+
+import hashlib
+import re
+from typing import List
+
+import xxhash
+
+
+def chunk_key(text: str) -> bytes:
+    """SHA-1 over whitespace/case-normalized chunk text (stable across processes)."""
+    return hashlib.sha1(" ".join(text.split()).lower().encode("utf-8")).digest()
+
+
+# Content-defined chunking works on sentences: Bedrock chunks are a few lines
+# (often one), so line boundaries would leave each chunk as a single
+# sub-block and only repeat the whole-chunk chunk_key dedup.
+CDC_MODULUS = 4  # expected sub-block length, in sentences
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?।])(?=\s)|(?<=\n)")
+
+
+def split_subblocks(text: str) -> List[str]:
+    """
+    Split a chunk at content-defined boundaries: a sentence whose
+    xxh64 hash is 0 mod CDC_MODULUS closes the current sub-block.
+    Identical passages split identically regardless of their offset.
+    Sub-blocks keep their whitespace, so "".join(blocks) == text.
+    """
+    blocks, current = [], []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        current.append(sentence)
+        normalized = " ".join(sentence.split()).lower()
+        if normalized and xxhash.xxh64_intdigest(normalized.encode("utf-8")) % CDC_MODULUS == 0:
+            blocks.append("".join(current))
+            current = []
+    if current:
+        blocks.append("".join(current))
+    return blocks
+
+
+def dedup_subblocks(chunks: List[str]) -> List[str]:
+    """
+    Drop sub-blocks already seen in an earlier chunk, leaving a single
+    "[see ¶N above]" reference per repeated run, where N is the 1-based
+    position of the chunk in the returned list (the prompt labels chunks
+    ¶1, ¶2, ...). Chunks that are fully repeated are dropped.
+    """
+    seen = {}  # sha1(sub-block) -> position of the chunk it first appeared in
+    result = []
+    for chunk in chunks:
+        position = len(result) + 1
+        parts, unique, last_ref = [], 0, None
+        for block in split_subblocks(chunk):
+            if not block.strip():
+                continue
+            key = chunk_key(block)
+            first = seen.get(key)
+            if first is None:
+                seen[key] = position
+                parts.append(block)
+                unique += 1
+                last_ref = None
+            elif first != position and first != last_ref:
+                # Keep the dropped block's leading whitespace so the marker
+                # stays separated from the preceding sentence
+                lead = block[:len(block) - len(block.lstrip())]
+                parts.append(f"{lead}[see ¶{first} above]")
+                last_ref = first
+        if unique:
+            result.append("".join(parts).strip())
+    return result
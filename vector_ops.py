@@ -0,0 +1,61 @@
+"""
+Vector helpers for the RAG agent (pure NumPy, no model or client setup)
+"""
+
+from typing import List
+
+import numpy as np
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Return float32 rows (or a single vector) scaled to unit L2 norm."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+QUANT_SCALE = 127  # unit-norm components in [-1, 1] map onto int8 [-127, 127]
+
+
+def quantize_int8(vectors: np.ndarray) -> np.ndarray:
+    """Quantize L2-normalized float vectors to symmetric int8."""
+    return np.clip(np.rint(vectors * QUANT_SCALE), -QUANT_SCALE, QUANT_SCALE).astype(np.int8)
+
+
+def int8_cosine_scores(matrix: np.ndarray, query_embedding: np.ndarray) -> np.ndarray:
+    """
+    Approximate cosine of each int8 row against an L2-normalized float query
+    einsum with an int32 dtype accumulates without int8 overflow and
+    without materializing a widened copy of the matrix.
+    """
+    dots = np.einsum("ij,j->i", matrix, quantize_int8(query_embedding), dtype=np.int32)
+    return dots.astype(np.float32) / (QUANT_SCALE * QUANT_SCALE)
+
+
+def mmr_select(query_embedding: np.ndarray, embeddings: np.ndarray,
+               k: int, lambda_mult: float) -> List[int]:
+    """
+    Pick up to k row indices by Maximal Marginal Relevance
+    Relevance and pairwise similarity come from one matmul each; the
+    selection loop only updates a running max-redundancy vector.
+    """
+    relevance = embeddings @ query_embedding
+    similarity = embeddings @ embeddings.T
+    redundancy = np.zeros(len(embeddings), dtype=np.float32)  # nothing selected yet
+    available = np.ones(len(embeddings), dtype=bool)
+    selected = []
+
+    for step in range(min(k, len(embeddings))):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(scores.argmax())
+        selected.append(best)
+        available[best] = False
+        # Seed from the first pick rather than zeros: similarities can be
+        # negative, and clamping them at 0 would change the selection
+        if step == 0:
+            redundancy = similarity[best].copy()
+        else:
+            np.maximum(redundancy, similarity[best], out=redundancy)
+
+    return selected